@@ -0,0 +1,13 @@
+"""pytest options, they have to be registered in the rootdir conftest."""
+
+import pytest
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    """Add the option to reuse generated test data."""
+    parser.addoption(
+        "--cached",
+        action="store_true",
+        default=False,
+        help="Reuse the generated test data from the pytest cache.",
+    )
@@ -5,6 +5,8 @@ from pathlib import Path
 import re
 from setuptools import setup, find_packages
 
+_VERSION_RE = re.compile(r'^__version__ = "(\d+\.\d+(?:\.\d+)?)"', re.M)
+
 
 def read(*parts):
     """Read the content of a file."""
@@ -15,8 +17,7 @@ def read(*parts):
 
 def find_version(*parts):
     """The the version in a given file."""
-    vers_file = read(*parts)
-    match = re.search(r'^__version__ = "(\d+.\d+.\d+)"', vers_file, re.M)
+    match = _VERSION_RE.search(read(*parts))
     if match is not None:
         return match.group(1)
     raise RuntimeError("Unable to find version string.")
@@ -80,8 +81,8 @@ setup(
             "testpath",
             "flake8",
             "mypy",
+            "orjson",
             "types-mock",
-            "types-PyYAML",
             "types-requests",
             "types-setuptools",
         ],
@@ -2,38 +2,70 @@
 
 from __future__ import annotations
 import argparse
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from functools import lru_cache, partial
+from html import escape
 from pathlib import Path
-import json
+import os
+import re
+import stat
 import warnings
 import sys
-from typing import Optional, TextIO, Union
-
-from cftime import num2date
-from dask import array as dask_array
-from hurry.filesize import alternative, size
-import numpy as np
-import xarray as xr
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Iterator, Optional, TextIO, Union
+
 from ._version import __version__
-from ._slk import get_slk_metadata, login
+from ._slk import get_slk_metadata, json_loads, login
+
+if TYPE_CHECKING:  # pragma: no cover
+    import xarray as xr
+
+_EXT_SET: frozenset[str] = frozenset(
+    (
+        ".nc",
+        ".nc4",
+        ".grb",
+        ".grib",
+        ".grib2",
+        ".grb2",
+        ".h5",
+        ".hdf5",
+    )
+)
+
+_PROG = "metadata-inspector"
+# Printed by the -V fast path of cli and by the argparse version action.
+_VERSION_STR = f"{_PROG} {__version__}"
+_URL_SCHEMES: frozenset[str] = frozenset(("http", "https", "s3", "gcs"))
+_ARCHIVE_SCHEMES: frozenset[str] = frozenset(("hsm", "slk"))
+
+# None marks the dataset title, its replacement depends on the dataset size.
+_REPR_REPLACE: dict[str, Optional[str]] = {
+    "xarray.Dataset": None,
+    "<svg class='icon xr-icon-file-text2'>": "<i class='fa fa-file-text-o'>",
+    "<svg class='icon xr-icon-database'>": "<i class='fa fa-database'>",
+    "</use></svg>": "</use></i>",
+}
+# Module prefixes are stripped from the repr, i.e. replaced by "".
+_REPR_RE = re.compile(
+    "|".join(
+        [re.escape(key) for key in _REPR_REPLACE] + [r"(?:numpy|np|dask)\."]
+    )
+)
 
 
 def _summarize_datavar(name: str, var: xr.DataArray, col_width: int) -> str:
+    import xarray as xr
+
     out = [
         xr.core.formatting.summarize_variable(name, var.variable, col_width)
     ]
     if var.attrs:
-        n_spaces = 0
-        for k in out[0]:
-            if k == " ":
-                n_spaces += 1
-            else:
-                break
-        out += [
-            n_spaces * " " + line
+        indent = " " * (len(out[0]) - len(out[0].lstrip(" ")))
+        out.extend(
+            indent + line
             for line in xr.core.formatting.attrs_repr(var.attrs).split("\n")
-        ]
+        )
     return "\n".join(out)
 
 
@@ -44,7 +76,7 @@ def parse_args(
 
     argp = argparse.ArgumentParser
     app = argp(
-        prog="metadata-inspector",
+        prog=_PROG,
         description=(
             "Inspect meta data of a weather/climate datasets "
             "with help of xarray"
@@ -67,16 +99,45 @@ def parse_args(
         "--version",
         "-V",
         action="version",
-        version="%(prog)s {version}".format(version=__version__),
+        version=_VERSION_STR,
     )
     parsed_args = app.parse_args(args)
     return parsed_args.input, parsed_args.html
 
 
+# Metadata of the hsm objects that has already been fetched, by path.
+_SLK_METADATA: dict[str, dict[str, dict[str, str]]] = {}
+
+
+def _cached_slk_metadata(input_file: str) -> dict[str, dict[str, str]]:
+    """Fetch the metadata of an hsm object only once per process.
+
+    Failed lookups are not stored and will be retried on the next call.
+    """
+    try:
+        return _SLK_METADATA[input_file]
+    except KeyError:
+        pass
+    metadata = get_slk_metadata(input_file)
+    if metadata is None:
+        raise ValueError("slk could not fetch the metadata")
+    _SLK_METADATA[input_file] = metadata
+    return metadata
+
+
 def dataset_from_hsm(input_file: str) -> xr.Dataset:
     """Create a dataset view from attributes."""
-    global_attrs: dict[str, dict[str, str]] = get_slk_metadata(input_file)
-    attrs = json.loads(global_attrs.pop("document", {}).pop("Keywords", "{}"))
+    from cftime import num2date
+    from dask import array as dask_array
+    import numpy as np
+    import xarray as xr
+
+    # Copy the cached metadata, it gets consumed below.
+    global_attrs: dict[str, dict[str, str]] = {
+        key: dict(value)
+        for key, value in _cached_slk_metadata(input_file).items()
+    }
+    attrs = json_loads(global_attrs.pop("document", {}).pop("Keywords", "{}"))
     nc_attrs = {}
     for key in ("netcdf", "netcdf_header"):
         for k, value in global_attrs.get(key, {}).items():
@@ -93,7 +154,7 @@ def dataset_from_hsm(input_file: str) -> xr.Dataset:
         dset[dim] = xr.DataArray(vec, name=dim, dims=(dim,), attrs=attrs[dim])
     for data_var in attrs.pop("data_vars", []):
         dims = attrs[data_var].pop("dims")
-        sizes = [dset[d].size for d in dims]
+        sizes = [dset.sizes[d] for d in dims]
         dset[data_var] = xr.DataArray(
             dask_array.empty(sizes),
             name=data_var,
@@ -103,74 +164,178 @@ def dataset_from_hsm(input_file: str) -> xr.Dataset:
     return dset
 
 
+def _walk(root: str, pattern: str = "*") -> Iterator[str]:
+    """Recursively yield all data files below root matching a pattern."""
+    match_all = pattern == "*"
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except PermissionError:  # pragma: no cover
+            continue  # pragma: no cover
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                name = entry.name
+                idx = name.rfind(".")
+                if (
+                    idx >= 0
+                    and name[idx:].lower() in _EXT_SET
+                    and (match_all or fnmatch(name, pattern))
+                ):
+                    yield entry.path
+
+
+def _is_url(inp_file: str) -> bool:
+    """Check if an input is a remote url, schemes are case insensitive."""
+    scheme, sep, _ = inp_file.partition("://")
+    return bool(sep) and scheme.lower() in _URL_SCHEMES
+
+
+def _classify(inp_file: str) -> tuple[str, str, str]:
+    """Classify an input in a single pass.
+
+    Returns
+    -------
+    tuple[str, str, str]: The kind of the input (url, hsm, zarr, dir, file,
+                          glob or an empty string if nothing was found), the
+                          resolved path and the pattern of glob inputs.
+    """
+    if _is_url(inp_file):
+        return "url", inp_file, ""
+    schema, _, path = inp_file.partition(":")
+    if not path:
+        path = schema
+    inp = Path(path).expanduser().absolute()
+    if schema in _ARCHIVE_SCHEMES or inp.parts[1] == "arch":
+        return "hsm", str(inp), ""
+    try:
+        mode = os.stat(inp).st_mode
+    except OSError:
+        mode = 0
+    if mode and inp.suffix in (".zarr",):
+        return "zarr", str(inp), ""
+    if stat.S_ISDIR(mode):
+        return "dir", str(inp), ""
+    if stat.S_ISREG(mode):
+        return "file", str(inp), ""
+    if inp.parent.is_dir():
+        return "glob", str(inp.parent), inp.name
+    return "", str(inp), ""
+
+
 def _get_files(input_: list[Union[str, Path]]) -> tuple[list[str], list[str]]:
     """Get all files from given input"""
 
     files_fs: list[str] = []
     files_archive: list[str] = []
-    extensions: tuple[str, ...] = (
-        ".nc",
-        ".nc4",
-        ".grb",
-        ".grib",
-        ".grib2",
-        ".grb2",
-        ".h5",
-        ".hdf5",
-    )
     for inp_file in input_:
-        schema, _, path = str(inp_file).partition(":")
-        if not path:
-            path = schema
-        inp = Path(path).expanduser().absolute()
-        parsed_url = urlparse(str(inp_file))
-        if parsed_url.scheme in ("http", "https", "s3", "gcs"):
-            files_fs.append(str(inp_file))
-        if schema in ("hsm", "slk") or inp.parts[1] == "arch":
-            files_archive.append(str(inp))
-        if inp.exists() and inp.suffix in (".zarr",):
-            files_fs.append(str(inp))
-        elif inp.is_dir() and inp.exists():
-            files_fs += [
-                str(inp_file)
-                for inp_file in inp.rglob("*")
-                if inp_file.suffix.lower() in extensions
-            ]
-        elif inp.is_file() and inp.exists():
-            files_fs.append(str(inp))
-        elif inp.parent.exists() and inp.parent.is_dir():
-            files_fs += [
-                str(inp_file)
-                for inp_file in inp.parent.rglob(inp.name)
-                if inp_file.suffix in extensions
-            ]
-    return sorted(files_fs), sorted(files_archive)
-
-
-def _open_datasets(files_fs: list[str], files_hsm: list[str]) -> xr.Dataset:
+        kind, path, pattern = _classify(str(inp_file))
+        if kind == "hsm":
+            files_archive.append(path)
+        elif kind in ("url", "zarr", "file"):
+            files_fs.append(path)
+        elif kind == "dir":
+            files_fs.extend(_walk(path))
+        elif kind == "glob":
+            files_fs.extend(_walk(path, pattern))
+    files_fs.sort()
+    files_archive.sort()
+    return files_fs, files_archive
+
+
+def _open_fs_dataset(files_fs: list[str]) -> xr.Dataset:
+    """Open the datasets that are stored on a (remote) file system."""
+    import xarray as xr
+
+    if files_fs[0].endswith(".zarr") or _is_url(files_fs[0]):
+        return xr.open_zarr(files_fs[0], consolidated=False)
+    return xr.open_mfdataset(
+        files_fs,
+        parallel=True,
+        combine="by_coords",
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        use_cftime=True,
+    )
+
+
+def _open_hsm_datasets(
+    files_hsm: list[str],
+) -> tuple[list[xr.Dataset], list[str]]:
+    """Create dataset views from the metadata of hsm archive files.
+
+    Returns
+    -------
+    tuple[list[xr.Dataset], list[str]]: The datasets that could be created
+                                        and a message for every file whose
+                                        metadata could not be read.
+    """
     dsets: list[xr.Dataset] = []
-    if files_fs:
-        if files_fs[0].endswith(".zarr") or urlparse(files_fs[0]).scheme in (
-            "http",
-            "https",
-            "s3",
-            "gcs",
-        ):
-            dsets.append(xr.open_zarr(files_fs[0], consolidated=False))
-        else:
-            dsets.append(
-                xr.open_mfdataset(
-                    files_fs,
-                    parallel=False,
-                    combine="by_coords",
-                    use_cftime=True,
-                )
-            )
+    errors: list[Exception] = []
+    failed: list[str] = []
+    with ThreadPoolExecutor(max_workers=min(16, len(files_hsm))) as pool:
+        futures = [pool.submit(dataset_from_hsm, f) for f in files_hsm]
+        for inp_file, future in zip(files_hsm, futures):
+            try:
+                dsets.append(future.result())
+            except Exception as error:
+                failed.append(f"{inp_file}: {error}")
+                errors.append(error)
+    if errors and not dsets:
+        raise errors[0]
+    return dsets, failed
+
+
+def _open_datasets(
+    files_fs: list[str], files_hsm: list[str]
+) -> tuple[xr.Dataset, list[str]]:
+    import xarray as xr
+
+    dsets: list[xr.Dataset] = []
+    failed: list[str] = []
     if files_hsm:
         login()
-        for inp_file in files_hsm:
-            dsets.append(dataset_from_hsm(inp_file))
-    return xr.merge(dsets)
+    if files_fs and files_hsm:
+        # Fetching the archive metadata is network bound, overlap it with
+        # opening the files on disk.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            fs_future = pool.submit(_open_fs_dataset, files_fs)
+            hsm_future = pool.submit(_open_hsm_datasets, files_hsm)
+            dsets, failed = hsm_future.result()
+            dsets.insert(0, fs_future.result())
+    elif files_fs:
+        dsets.append(_open_fs_dataset(files_fs))
+    elif files_hsm:
+        dsets, failed = _open_hsm_datasets(files_hsm)
+    if len(dsets) == 1:
+        return dsets[0], failed
+    # Values are never read, don't compare variables shared by the datasets.
+    return xr.merge(dsets, compat="override"), failed
+
+
+@lru_cache(maxsize=None)
+def _configure_xr() -> None:
+    """Set up the global xarray text formatting, once per process."""
+    import xarray as xr
+
+    xr.core.options.OPTIONS.update(
+        {
+            "display_expand_data_vars": True,
+            "display_expand_attrs": True,
+            "display_expand_data": True,
+            "display_max_rows": 100,
+        }
+    )
+    xr.core.formatting.data_vars_repr = partial(
+        xr.core.formatting._mapping_repr,
+        title="Data variables",
+        summarizer=_summarize_datavar,
+        expand_option_name="display_expand_data_vars",
+    )
 
 
 def main(
@@ -186,12 +351,15 @@ def main(
     html: bool, default: True
         If true a representation suitable for html is displayed.
     """
+    from hurry.filesize import alternative, size
+    import xarray as xr
+
     xr.core.formatting.EMPTY_REPR = "    *not enough information for display*"
     files_fs, files_hsm = _get_files(input_files)
     if not files_fs and not files_hsm:
         return "No files found", sys.stderr
     try:
-        dset = _open_datasets(files_fs, files_hsm)
+        dset, failed = _open_datasets(files_fs, files_hsm)
     except Exception as error:
         error_header = (
             "No data found, file(s) might be corrupted. "
@@ -216,37 +384,34 @@ def main(
     if html:
         out_str = xr.core.formatting_html.dataset_repr(dset)
     else:
-        xr.core.options.OPTIONS["display_expand_data_vars"] = True
-        xr.core.options.OPTIONS["display_expand_attrs"] = True
-        xr.core.options.OPTIONS["display_expand_data"] = True
-        xr.core.options.OPTIONS["display_max_rows"] = 100
-        xr.core.formatting.data_vars_repr = partial(
-            xr.core.formatting._mapping_repr,
-            title="Data variables",
-            summarizer=_summarize_datavar,
-            expand_option_name="display_expand_data_vars",
-        )
+        _configure_xr()
         out_str = xr.core.formatting.dataset_repr(dset)
-    replace_str = (
-        ("xarray.Dataset", f"Dataset (dataset-size: {fsize})"),
-        (
-            "<svg class='icon xr-icon-file-text2'>",
-            "<i class='fa fa-file-text-o'>",
-        ),
-        ("<svg class='icon xr-icon-database'>", "<i class='fa fa-database'>"),
-        ("</use></svg>", "</use></i>"),
-        ("numpy.", ""),
-        ("np.", ""),
-        ("dask.", ""),
-    )
-    for entry, replace in replace_str:
-        out_str = out_str.replace(entry, replace)
+    title = f"Dataset (dataset-size: {fsize})"
+
+    def _replace(match: re.Match[str]) -> str:
+        replace = _REPR_REPLACE.get(match.group(0), "")
+        return title if replace is None else replace
 
+    out_str = _REPR_RE.sub(_replace, out_str)
+    if failed and html:
+        out_str += (
+            "<p><b>Warning:</b> Could not read the metadata of:<br>"
+            + "<br>".join(escape(msg) for msg in failed)
+            + "</p>"
+        )
+    elif failed:
+        out_str += "\nCould not read the metadata of:\n" + "\n".join(
+            f"    {msg}" for msg in failed
+        )
     return out_str, sys.stdout
 
 
 def cli(args: Optional[list[str]] = None) -> None:
     """Command line argument inteface."""
+    if args is None and sys.argv[1:] in (["-V"], ["--version"]):
+        # Answer the most common "is it installed?" query right away.
+        print(_VERSION_STR, flush=True)
+        return
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore")
         try:
@@ -6,38 +6,89 @@ tools.
 
 from __future__ import annotations
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from getpass import getuser
 import json
 from pathlib import Path
 import os
+import re
 import shutil
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Mapping, Optional
 import warnings
 from subprocess import run, PIPE, SubprocessError
 
-from hurry.filesize import alternative, size
-import requests
+try:
+    from orjson import JSONDecodeError, dumps as json_dumps, loads as _loads
+
+    def json_loads(obj: bytes | str) -> Any:
+        """Deserialise json, fall back to the stdlib for NaN and Infinity.
+
+        The Keywords of hsm objects are written by python's json module,
+        which encodes NaN fill values as ``NaN``. orjson rejects those.
+        """
+        try:
+            return _loads(obj)
+        except JSONDecodeError:
+            return json.loads(obj)
+
+except ImportError:  # pragma: no cover
+    from json import loads as json_loads  # type: ignore[assignment]
+
+    def json_dumps(obj: Any) -> bytes:  # type: ignore[misc]
+        """Serialise an object to json encoded bytes."""
+        return json.dumps(obj).encode()
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    import requests
 
 SLK_HELPERS_BIN = "/sw/spack-levante/slk_helpers-1.9.3-5hmec4/bin"
 SLK_BIN = "/sw/spack-levante/slk-3.3.91-wuylnb/bin/slk"
 JDK_BIN = "/sw/spack-levante/openjdk-17.0.0_35-k5o6dr/bin"
 JAVA_HOME = "/sw/spack-levante/openjdk-17.0.0_35-k5o6dr"
 SLK = "slk"
+SLK_PATH = f"{SLK_BIN}:{SLK_HELPERS_BIN}:{JDK_BIN}"
 
 SESSION_PATH = Path("~").expanduser() / ".slk" / "config.json"
+SESSION_DATE_FMTS = ("%a %b %d %H:%M:%S %Z %Y", "%a %b %d %H:%M:%S %Y")
+# Lines of the slk_helpers metadata output are either section headers,
+# indented "key: value" pairs or continuations of the previous value.
+_METADATA_LINE_RE = re.compile(
+    r"(?P<section>(?:netcdf|document).*)"
+    r"|\s(?P<key>[^:]*):?(?P<value>.*)"
+    r"|(?P<cont>.+)"
+)
 
 
-def get_env() -> dict[str, str]:
-    """Load the slk module."""
+@lru_cache(maxsize=None)
+def get_env() -> Mapping[str, str]:
+    """Load the slk module.
+
+    The environment is only set up once per process, callers that need to
+    modify it have to create a copy: ``dict(get_env())``.
+    """
     env: dict[str, str] = os.environ.copy()
     if shutil.which("slk") is not None:
-        return env  # pragma: no cover
-    env["PATH"] = f"{SLK_BIN}:{SLK_HELPERS_BIN}:{JDK_BIN}:{env['PATH']}"
+        return MappingProxyType(env)  # pragma: no cover
+    env["PATH"] = f"{SLK_PATH}:{env['PATH']}"
     env["JAVA_HOME"] = JAVA_HOME
-    return env
+    return MappingProxyType(env)
 
 
-def get_file_size(input_path: str) -> str:
+@lru_cache(maxsize=None)
+def _size_pool() -> ThreadPoolExecutor:
+    """Create the pool that queries object sizes for all metadata calls.
+
+    The pool is shared and bounded, so concurrent metadata calls do not
+    start more slk_helpers processes than it has workers.
+    """
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def get_file_size(input_path: str) -> Optional[str]:
     """Extract the size of an object on the HSM store.
 
     Parameters
@@ -47,24 +98,27 @@ def get_file_size(input_path: str) -> str:
 
     Returns
     -------
-    str: A string representation of the size of the ojbect
+    str: A string representation of the size of the ojbect, None if the
+         size could not be determined.
     """
+    from hurry.filesize import alternative, size
+
     command = ["slk_helpers", "size", input_path]
     try:
         res = run(command, env=get_env(), check=True, stdout=PIPE, stderr=PIPE)
-    except SubprocessError as error:  # pragma: no cover
+    except (SubprocessError, OSError) as error:  # pragma: no cover
         warnings.warn(
             f"Error: could not get meta-data: {error}"
         )  # pragma: no cover
-        return "unkown"  # pragma: no cover
+        return None  # pragma: no cover
     try:
         fsize = int(res.stdout.decode().strip())
-    except TypeError:  # pragma: no cover
-        return "unkown"  # pragma: no cover
+    except (TypeError, ValueError):  # pragma: no cover
+        return None  # pragma: no cover
     return size(fsize, system=alternative)
 
 
-def get_slk_metadata(input_path: str) -> dict[str, dict[str, str]]:
+def get_slk_metadata(input_path: str) -> Optional[dict[str, dict[str, str]]]:
     """Extract dataset metdata from path in the hsm.
 
     Parameters
@@ -75,16 +129,19 @@ def get_slk_metadata(input_path: str) -> dict[str, dict[str, str]]:
 
     Returns
     -------
-    str: string representation of the metdata
+    dict: the metdata grouped by section, None if it could not be fetched
     """
     command = ["slk_helpers", "metadata", input_path]
+    # slk_helpers only accepts one resource per call and every call starts a
+    # new jvm, query the size while the metadata is being fetched.
+    fsize = _size_pool().submit(get_file_size, input_path)
     try:
         res = run(command, env=get_env(), check=True, stdout=PIPE, stderr=PIPE)
-    except SubprocessError as error:  # pragma: no cover
+    except (SubprocessError, OSError) as error:  # pragma: no cover
         warnings.warn(
             f"Error: could not get meta-data: {error}"
         )  # pragma: no cover
-        return {}  # pragma: no cover
+        return None  # pragma: no cover
     # This needs to be done because the output of the command is only nearly
     # yaml. That is the ":" for the first keys are missing:
     # For example:
@@ -97,35 +154,69 @@ def get_slk_metadata(input_path: str) -> dict[str, dict[str, str]]:
     # keys manually.
     data: dict[str, dict[str, str]] = {}
     data.setdefault("netcdf", {})
-    for line in res.stdout.decode().split("\n"):
-        if line.startswith("netcdf") or line.startswith("document"):
-            main_key = line.strip()
-            data[main_key] = {}
+    for line in res.stdout.decode().splitlines():
+        match = _METADATA_LINE_RE.match(line)
+        if match is None:
             continue
-        if line and not line[0].strip():
-            key, _, value = line.partition(":")
+        section, key, value, cont = match.group(
+            "section", "key", "value", "cont"
+        )
+        if section is not None:
+            main_key = section.strip()
+            data[main_key] = {}
+        elif key is not None:
             current_key = key.strip()
             data[main_key][current_key] = value.strip()
-        elif line:
-            data[main_key][current_key] += line.strip()
-    data["netcdf"]["file_size"] = get_file_size(input_path)
+        else:
+            data[main_key][current_key] += cont.strip()
+    file_size = fsize.result()
+    if file_size is None:
+        return None  # pragma: no cover
+    data["netcdf"]["file_size"] = file_size
     return data
 
 
-def get_expiration_date() -> datetime:
-    """Get the expiration date of the session key."""
-    session_path = Path("~").expanduser() / ".slk" / "config.json"
-    now = datetime.now()
-    for fmt in ("%a %b %d %H:%M:%S %Z %Y", "%a %b %d %H:%M:%S %Y"):
+@lru_cache(maxsize=1)
+def _read_expiration_date(
+    session_path: Path, mtime_ns: int, file_size: int
+) -> Optional[datetime]:
+    """Parse the expiration date of a session file.
+
+    The modification time and size of the file are part of the cache key,
+    the file is only parsed again once it has been changed.
+    """
+    try:
+        date = json_loads(session_path.read_bytes())["expireDate"]
+    except (OSError, KeyError, ValueError):  # pragma: no cover
+        return None  # pragma: no cover
+    for fmt in SESSION_DATE_FMTS:
         try:
-            with session_path.open() as f_obj:
-                date = json.load(f_obj).get("expireDate", now.strftime(fmt))
             return datetime.strptime(date, fmt)
-        except FileNotFoundError:  # pragma: no cover
-            break  # pragma: no cover
         except ValueError:  # pragma: no cover
             pass  # pragma: no cover
-    return now
+    return None  # pragma: no cover
+
+
+def get_expiration_date() -> datetime:
+    """Get the expiration date of the session key."""
+    try:
+        stat = SESSION_PATH.stat()
+    except FileNotFoundError:  # pragma: no cover
+        return datetime.now()  # pragma: no cover
+    exp_date = _read_expiration_date(
+        SESSION_PATH, stat.st_mtime_ns, stat.st_size
+    )
+    return exp_date or datetime.now()
+
+
+@lru_cache(maxsize=None)
+def _get_session() -> requests.Session:
+    """Create one http session whose connections are reused."""
+    import requests
+
+    session = requests.Session()
+    session.verify = False
+    return session
 
 
 def _login_via_request(passwd: str) -> None:
@@ -139,21 +230,28 @@ def _login_via_request(passwd: str) -> None:
             "type": "authentication",
         }
     }
-    headers = {"Content-type": "application/json"}
-    fmt = "%a %b %d %H:%M:%S %Z %Y"
-    exp_date = (datetime.now() + timedelta(days=20)).astimezone().strftime(fmt)
-    url = "https://archive.dkrz.de/api/v2/authentication"
-    res = requests.post(
-        url, data=json.dumps(data), headers=headers, verify=False
+    exp_date = (
+        (datetime.now() + timedelta(days=20))
+        .astimezone()
+        .strftime(SESSION_DATE_FMTS[0])
     )
+    url = "https://archive.dkrz.de/api/v2/authentication"
+    with warnings.catch_warnings():
+        # Only silence urllib3's warning about the unverified request made
+        # here, not for the whole process.
+        warnings.filterwarnings("ignore", message="Unverified HTTPS request")
+        res = _get_session().post(
+            url,
+            data=json_dumps(data),
+            headers={"Content-type": "application/json"},
+        )
     key = (
         res.json().get("data", {}).get("attributes", {}).get("session_key", "")
     )
     if key:
         sec = {"user": getuser(), "sessionKey": key, "expireDate": exp_date}
         SESSION_PATH.parent.mkdir(exist_ok=True, parents=True)
-        with SESSION_PATH.open("w") as f_obj:
-            json.dump(sec, f_obj)
+        SESSION_PATH.write_bytes(json_dumps(sec))
         SESSION_PATH.chmod(0o600)
 
 
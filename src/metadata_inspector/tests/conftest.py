@@ -2,13 +2,16 @@
 
 from __future__ import annotations
 import base64
-from functools import partial
+import hashlib
+from functools import lru_cache, partial
 import json
 import os
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import Any, Generator
+import pickle
+import shutil
+from typing import Any, Callable, Generator
 import subprocess
+from types import SimpleNamespace
 
 import pytest
 import mock
@@ -18,10 +21,9 @@ import xarray as xr
 
 import threading
 import http.server
-import socketserver
 import metadata_inspector._slk  # noqa
 
-global_meta_data = """
+global_meta_data = b"""
 netcdf
   Var_Long_Name: time,Longitude,Latitude,pressure,Eastward Wind
   License: CMIP6 model data produced by CSIRO is licensed under a Creative
@@ -175,11 +177,27 @@ meta_data = {
         "dims": ["rlat", "rlon"],
     },
 }
+# Data cached with --cached is only reused as long as the code generating it
+# and the xarray version that pickled it stay the same.
+_CACHE_KEY = hashlib.sha256(
+    Path(__file__).read_bytes() + xr.__version__.encode()
+).hexdigest()[:16]
+# Turns iso time stamps (2020-01-01T00:00) into %Y%m%d%H%M strings.
+_STAMP_TABLE = str.maketrans("", "", "-T:")
+# The mocked slk_helpers output is constant, build it only once.
+_TAR_OUTPUT = (
+    f"document\n   Keywords: {json.dumps(meta_data)}"
+    "\n   Version: ae7677769b0a757248659ddbbb83f224"
+).encode()
 
 
 class SubProcess:
-    def __init__(self, cmd: list[str], is_fake: bool = True) -> None:
-        if is_fake:
+    __slots__ = ("_stdout", "_is_fake")
+
+    def __init__(self, cmd: list[str] | bytes, is_fake: bool = True) -> None:
+        if isinstance(cmd, bytes):
+            self._stdout = cmd
+        elif is_fake:
             self._stdout = "\n".join(cmd).encode()
         else:
             res = subprocess.Popen(
@@ -196,14 +214,24 @@ class SubProcess:
         return self._stdout
 
 
+# The mocked slk_helpers replies never change, reuse one result for each.
+_SLK_HELPERS_RESULTS = {
+    "tar": SubProcess(_TAR_OUTPUT),
+    "metadata": SubProcess(global_meta_data),
+    "size": SubProcess(b"1535041\n"),
+    "": SubProcess(b""),
+}
+
+
 class RequestMock:
+    __slots__ = ("url", "data", "headers", "out")
+
     def __init__(
         self,
         url: str,
-        data: dict[str, dict[str, str]] | None = None,
+        data: bytes | None = None,
         headers: dict[str, str] | None = None,
         out: dict[str, dict[str, str]] | None = None,
-        **kwargs: Any,
     ) -> None:
         self.url = url
         self.data = data
@@ -214,15 +242,60 @@ class RequestMock:
         """Mock the json get value."""
         return self.out or {}
 
-    @classmethod
-    def post(cls, url: str, **kwargs: Any) -> RequestMock:
+    @staticmethod
+    def post(url: str, **kwargs: Any) -> RequestMock:
         """Mock the rest post method."""
-        return cls(url, **kwargs)
-
-    @classmethod
-    def get(cls, url: str, **kwargs: Any) -> RequestMock:
-        """Mock the rest get method."""
-        return cls(url, **kwargs)
+        return RequestMock(url, **kwargs)
+
+
+class MemoryHandler(http.server.BaseHTTPRequestHandler):
+    """Serve the content of files that are held in memory."""
+
+    files: dict[str, bytes] = {}
+
+    def _listing(self, path: str) -> bytes | None:
+        """Create an html directory listing, as fsspec expects."""
+        start = len(path)
+        entries = {
+            key[start:].partition("/")[0]
+            for key in self.files
+            if key.startswith(path)
+        }
+        if not entries:
+            return None
+        links = "".join(f'<a href="{entry}">{entry}</a>' for entry in entries)
+        return f"<html><body>{links}</body></html>".encode()
+
+    def _send_head(self) -> bytes | None:
+        path = self.path.partition("?")[0]
+        content = self.files.get(path)
+        if content is None and path.endswith("/"):
+            content = self._listing(path)
+        if content is None:
+            self.send_error(404)
+            return None
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        return content
+
+    def log_message(self, *args: Any) -> None:
+        """Don't write every request to stderr."""
+
+    def do_HEAD(self) -> None:
+        self._send_head()
+
+    def do_GET(self) -> None:
+        content = self._send_head()
+        if content is not None:
+            self.wfile.write(content)
+
+
+def store_bytes(value: Any) -> bytes:
+    """Get the content of a zarr store item, zarr>=3 wraps it in a Buffer."""
+    if hasattr(value, "to_bytes"):
+        return value.to_bytes()
+    return bytes(value)
 
 
 def run(command: list[str], **kwargs: Any) -> SubProcess:
@@ -231,29 +304,35 @@ def run(command: list[str], **kwargs: Any) -> SubProcess:
     main_command = command[0]
     if main_command == "slk_helpers":
         sub_cmd = command[1]
-        if sub_cmd == "metadata":
-            input_path = command[2]
-            if input_path.endswith(".tar"):
-                cmd_output = "document\n"
-                cmd_output += "   Keywords: " + json.dumps(meta_data)
-                cmd_output += "\n   Version: ae7677769b0a757248659ddbbb83f224"
-            else:
-                cmd_output = global_meta_data
-        elif sub_cmd == "size":
-            cmd_output = "1535041\n"
-        else:
-            cmd_output = ""
-        return SubProcess([cmd_output])
+        if sub_cmd == "metadata" and command[2].endswith(".tar"):
+            return _SLK_HELPERS_RESULTS["tar"]
+        return _SLK_HELPERS_RESULTS.get(sub_cmd, _SLK_HELPERS_RESULTS[""])
     else:
         return SubProcess(command, is_fake=False)
 
 
+@lru_cache(maxsize=4)
+def _coord_grid(
+    size: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Create the x, y, lon and lat coordinates of a test dataset.
+
+    The arrays are shared by all datasets of the same size, they are made
+    read-only so that no test can change them for the others.
+    """
+    x_coord = np.linspace(-10, -5, size)
+    y_coord = np.linspace(120, 125, size)
+    lat, lon = np.meshgrid(y_coord, x_coord, copy=False)
+    grid = (x_coord, y_coord, lon, lat)
+    for array in grid:
+        array.setflags(write=False)
+    return grid
+
+
 def create_data(variable_name: str, size: int) -> xr.Dataset:
     """Create a netcdf dataset."""
     coords: dict[str, np.ndarray] = {}
-    coords["x"] = np.linspace(-10, -5, size)
-    coords["y"] = np.linspace(120, 125, size)
-    lat, lon = np.meshgrid(coords["y"], coords["x"])
+    coords["x"], coords["y"], lon, lat = _coord_grid(size)
     lon_vec = xr.DataArray(lon, name="Lg", coords=coords, dims=("y", "x"))
     lat_vec = xr.DataArray(lat, name="Lt", coords=coords, dims=("y", "x"))
     coords["time"] = np.array(
@@ -265,124 +344,177 @@ def create_data(variable_name: str, size: int) -> xr.Dataset:
         ]
     )
     dims = (4, size, size)
-    data_array = np.empty(dims)
-    for time in range(dims[0]):
-        data_array[time] = np.zeros((size, size))
     dset = xr.DataArray(
-        data_array,
+        np.zeros(dims, dtype=np.float32),
         dims=("time", "y", "x"),
         coords=coords,
         name=variable_name,
     )
-    data_array = np.zeros(dims)
     return xr.Dataset(
         {variable_name: dset, "Lt": lon_vec, "Lg": lat_vec}
     ).set_coords(list(coords.keys()))
 
 
+def cached_data(
+    config: pytest.Config, variable_name: str, size: int
+) -> xr.Dataset:
+    """Create a netcdf dataset, reuse a pickled copy if --cached is set."""
+    if not config.getoption("--cached") or config.cache is None:
+        return create_data(variable_name, size)
+    cache_path = (
+        config.cache.mkdir("md-inspektor")
+        / f"{variable_name}-{size}-{_CACHE_KEY}.pkl"
+    )
+    if cache_path.is_file():
+        with cache_path.open("rb") as f_obj:
+            return pickle.load(f_obj)
+    dset = create_data(variable_name, size)
+    with cache_path.open("wb") as f_obj:
+        pickle.dump(dset, f_obj)
+    return dset
+
+
+def cached_files(
+    config: pytest.Config,
+    name: str,
+    target: Path,
+    create: Callable[[Path], None],
+) -> None:
+    """Create test files, reuse an archived copy if --cached is set."""
+    if not config.getoption("--cached") or config.cache is None:
+        create(target)
+        return
+    archive = config.cache.mkdir("md-inspektor") / f"{name}-{_CACHE_KEY}.tar"
+    if archive.is_file():
+        shutil.unpack_archive(archive, target)
+        return
+    create(target)
+    shutil.make_archive(str(archive.with_suffix("")), "tar", target)
+
+
 @pytest.fixture(scope="session")
-def slk_bin() -> Generator[Path, None, None]:
+def slk_bin(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Generator[Path, None, None]:
     """Create a mock folder where we can add mock slk binaries."""
-    with TemporaryDirectory() as slk_dir:
-        with TemporaryDirectory() as td:
-            module = Path(td) / "modulecmd.tcl"
-            path = f"{slk_dir}:{os.environ['PATH']}"
-            slk_path = Path(slk_dir) / "slk"
-            slk_helpers = Path(slk_dir) / "slk_helpers"
-            with module.open("w", encoding="utf-8") as tf:
-                tf.write(
-                    f"#!/bin/bash\n echo os.environ[\\'PATH\\'] = \\'{path}\\'"
-                )
-            with slk_path.open("w", encoding="utf-8") as tf:
-                tf.write("#!/bin/bash\n")
-            with slk_helpers.open("w", encoding="utf-8") as tf:
-                tf.write("#!/bin/bash\n")
-            for inp_file in (slk_path, slk_helpers, module):
-                inp_file.chmod(0o755)
-            yield module
+    slk_dir = tmp_path_factory.mktemp("slk_bin")
+    module = tmp_path_factory.mktemp("module") / "modulecmd.tcl"
+    path = f"{slk_dir}:{os.environ['PATH']}"
+    slk_path = slk_dir / "slk"
+    slk_helpers = slk_dir / "slk_helpers"
+    with module.open("w", encoding="utf-8") as tf:
+        tf.write(f"#!/bin/bash\n echo os.environ[\\'PATH\\'] = \\'{path}\\'")
+    with slk_path.open("w", encoding="utf-8") as tf:
+        tf.write("#!/bin/bash\n")
+    with slk_helpers.open("w", encoding="utf-8") as tf:
+        tf.write("#!/bin/bash\n")
+    for inp_file in (slk_path, slk_helpers, module):
+        inp_file.chmod(0o755)
+    yield module
 
 
 @pytest.fixture(scope="function")
 def patch_file(session_path: Path) -> Generator[Path, None, None]:
     req = {"data": {"attributes": {"session_key": "secret"}}}
-    post = partial(RequestMock.post, out=req)
+    # A plain namespace instead of a requests.Session, the tests never
+    # have to import or set up requests.
+    session = SimpleNamespace(post=partial(RequestMock.post, out=req))
     env = os.environ.copy()
     env["LC_TELEPHONE"] = base64.b64encode("foo".encode()).decode()
     with mock.patch.dict(os.environ, env, clear=True):
         with mock.patch("metadata_inspector._slk.SESSION_PATH", session_path):
-            with mock.patch("requests.post", post):
-                with mock.patch("requests.get", RequestMock.get):
-                    with mock.patch("metadata_inspector._slk.run", run):
-                        yield session_path
+            with mock.patch(
+                "metadata_inspector._slk._get_session", lambda: session
+            ):
+                with mock.patch("metadata_inspector._slk.run", run):
+                    yield session_path
 
 
 @pytest.fixture(scope="session")
-def data() -> Generator[xr.Dataset, None, None]:
+def data(pytestconfig: pytest.Config) -> Generator[xr.Dataset, None, None]:
     """Define a simple dataset with a blob in the middle."""
-    dset = create_data("precip", 100)
+    dset = cached_data(pytestconfig, "precip", 100)
     yield dset
 
 
 @pytest.fixture(scope="session")
-def zarr_file(data: xr.Dataset) -> Generator[Path, None, None]:
+def zarr_file(
+    data: xr.Dataset,
+    pytestconfig: pytest.Config,
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Generator[Path, None, None]:
     """Save a zarr dataset to disk."""
-    with TemporaryDirectory() as td:
-        zarr_data = Path(td) / "precip.zarr"
-        data.to_zarr(zarr_data, mode="w", consolidated=True, compute=True)
-        yield zarr_data
+
+    def _create(td: Path) -> None:
+        data.to_zarr(td / "precip.zarr", mode="w", consolidated=False)
+
+    td = tmp_path_factory.mktemp("zarr")
+    cached_files(pytestconfig, "zarr_file", td, _create)
+    yield td / "precip.zarr"
 
 
 @pytest.fixture(scope="session")
-def netcdf_files(data: xr.Dataset) -> Generator[Path, None, None]:
+def netcdf_files(
+    data: xr.Dataset,
+    pytestconfig: pytest.Config,
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Generator[Path, None, None]:
     """Save data with a blob to file."""
 
-    with TemporaryDirectory() as td:
-        for time in (data.time[:2], data.time[2:]):
-            time1 = pd.Timestamp(time.values[0]).strftime("%Y%m%d%H%M")
-            time2 = pd.Timestamp(time.values[1]).strftime("%Y%m%d%H%M")
+    def _create(td: Path) -> None:
+        stamps = [
+            stamp.translate(_STAMP_TABLE)
+            for stamp in np.datetime_as_string(data.time.values, unit="m")
+        ]
+        for start, time in ((0, data.time[:2]), (2, data.time[2:])):
             out_file = (
-                Path(td)
+                td
                 / "the_project"
                 / "test1"
                 / "precip"
-                / f"precip_{time1}-{time2}.nc"
+                / f"precip_{stamps[start]}-{stamps[start + 1]}.nc"
             )
             out_file.parent.mkdir(exist_ok=True, parents=True)
             data.sel(time=time).to_netcdf(
                 out_file, mode="w", engine="h5netcdf"
             )
-        yield Path(td)
+
+    td = tmp_path_factory.mktemp("netcdf")
+    cached_files(pytestconfig, "netcdf_files", td, _create)
+    yield td
 
 
 @pytest.fixture(scope="session")
-def session_path() -> Generator[Path, None, None]:
-    with TemporaryDirectory() as temp_dir:
-        yield Path(temp_dir) / "slk.json"
+def session_path(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Generator[Path, None, None]:
+    yield tmp_path_factory.mktemp("slk_session") / "slk.json"
 
 
 @pytest.fixture(scope="session")
 def https_server() -> Generator[str, None, None]:
-    temp_dir = TemporaryDirectory()
-    zarr_dir = Path(temp_dir.name) / "zarr_data"
-    zarr_data = zarr_dir / "precip.zarr"
     coords = {
         "time": pd.date_range("2020-01-01", periods=10),
         "lat": np.linspace(-90, 90, 180),
         "lon": np.linspace(0, 360, 360),
     }
-    data = np.random.rand(10, 180, 360)
+    data = np.random.default_rng(0).random((10, 180, 360), dtype=np.float32)
     dset = xr.Dataset(
         {"precip": (["time", "lat", "lon"], data)}, coords=coords
     )
-    dset.to_zarr(zarr_data, mode="w", consolidated=True)
-    os.chdir(temp_dir.name)
-    handler = http.server.SimpleHTTPRequestHandler
-    httpd = socketserver.TCPServer(("localhost", 8000), handler)
+    # The store is only read through http, keep it in memory.
+    store: dict[str, Any] = {}
+    dset.to_zarr(store, mode="w", consolidated=True)
+    files = {
+        f"/zarr_data/precip.zarr/{key}": store_bytes(value)
+        for key, value in store.items()
+    }
+    handler = type("Handler", (MemoryHandler,), {"files": files})
+    httpd = http.server.ThreadingHTTPServer(("localhost", 0), handler)
     print("start server")
     server_thread = threading.Thread(target=httpd.serve_forever)
     server_thread.daemon = True
     server_thread.start()
-    yield "http://localhost:8000/zarr_data/"
+    yield f"http://localhost:{httpd.server_address[1]}/zarr_data/"
     print("shutdown server")
     httpd.shutdown()
-    temp_dir.cleanup()
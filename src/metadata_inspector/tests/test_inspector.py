@@ -1,57 +1,80 @@
 """Tests for the command line interface."""
 
+from datetime import datetime
 from pathlib import Path
-from tempfile import NamedTemporaryFile
+import math
 import sys
+import mock
 import pytest
+import xarray as xr
 
 
-def test_cli(capsys: pytest.CaptureFixture, patch_file: Path) -> None:
+def test_cli(
+    capsys: pytest.CaptureFixture, patch_file: Path, tmp_path: Path
+) -> None:
     """Test the help stirng."""
     from metadata_inspector import cli
 
-    with NamedTemporaryFile(suffix=".nc") as temp_file:
-        cli([temp_file.name])
-        cap = capsys.readouterr()
-        assert cap.out == ""
-        assert "No data found" in cap.err
-        cli([temp_file.name, "--html"])
-        cap = capsys.readouterr()
-        assert cap.err == ""
-        assert "Error" in cap.out
+    temp_file = tmp_path / "empty.nc"
+    temp_file.touch()
+    cli([str(temp_file)])
+    cap = capsys.readouterr()
+    assert cap.out == ""
+    assert "No data found" in cap.err
+    cli([str(temp_file), "--html"])
+    cap = capsys.readouterr()
+    assert cap.err == ""
+    assert "Error" in cap.out
     with pytest.raises(SystemExit):
         cli(["--help"])
 
 
-def test_zarr(zarr_file: Path, patch_file: Path) -> None:
-    """Test reading a zarr file."""
+def test_version(capsys: pytest.CaptureFixture) -> None:
+    """Test the version string."""
+    from metadata_inspector import cli, __version__
+
+    with mock.patch.object(sys, "argv", ["metadata-inspector", "-V"]):
+        cli()
+    out = capsys.readouterr().out
+    assert out.strip() == f"metadata-inspector {__version__}"
+    with pytest.raises(SystemExit):
+        cli(["--version"])
+    assert capsys.readouterr().out == out
+
+
+def test_no_files(patch_file: Path) -> None:
+    """Test calling main without any input."""
     from metadata_inspector import main
 
     out, text_io = main([])
     assert out == "No files found"
     assert text_io == sys.stderr
 
-    out, text_io = main([zarr_file], html=False)
-    assert "precip" in out
-    assert text_io == sys.stdout
-
-    out, text_io = main([zarr_file], html=True)
-    assert "html" in out
-
 
-def test_netcdf(netcdf_files: Path, patch_file: Path) -> None:
-    """Test reading netcdf files."""
+@pytest.mark.parametrize("html", [False, True])
+@pytest.mark.parametrize("fixture_name", ["zarr_file", "netcdf_files"])
+def test_main_roundtrip(
+    fixture_name: str,
+    html: bool,
+    request: pytest.FixtureRequest,
+    patch_file: Path,
+) -> None:
+    """Test reading zarr and netcdf files."""
     from metadata_inspector import main
 
-    out, text_io = main([])
-    assert out == "No files found"
-    assert text_io == sys.stderr
-    out, text_io = main([netcdf_files], html=False)
+    out, text_io = main([request.getfixturevalue(fixture_name)], html=html)
     assert "precip" in out
     assert text_io == sys.stdout
+    if html:
+        assert "html" in out
+
 
-    out, text_io = main([netcdf_files], html=True)
-    assert "html" in out
+def test_json_loads() -> None:
+    """Test decoding json that contains NaN values."""
+    from metadata_inspector import json_loads
+
+    assert json_loads(b'{"a": 1}') == {"a": 1}
+    assert math.isnan(json_loads('{"_FillValue": NaN}')["_FillValue"])
 
 
 def test_login(patch_file: Path) -> None:
@@ -63,6 +86,27 @@ def test_login(patch_file: Path) -> None:
     assert patch_file.is_file()
 
 
+def test_expiration_date(patch_file: Path) -> None:
+    """Test reading the expiration date of the session."""
+    from metadata_inspector._slk import get_expiration_date, login
+
+    login()
+    exp_date = get_expiration_date()
+    assert exp_date > datetime.now()
+    assert get_expiration_date() is exp_date
+
+
+def test_get_env() -> None:
+    """Test that the slk environment is only set up once."""
+    from metadata_inspector._slk import get_env
+
+    env = get_env()
+    assert env is get_env()
+    assert "PATH" in env
+    with pytest.raises(TypeError):
+        env["PATH"] = "foo"  # type: ignore[index]
+
+
 def test_fileiter(netcdf_files: Path, patch_file: Path) -> None:
     """Test searchig for files."""
     from metadata_inspector import _get_files
@@ -76,6 +120,26 @@ def test_fileiter(netcdf_files: Path, patch_file: Path) -> None:
     assert out == nc_files
 
 
+def test_classify(netcdf_files: Path) -> None:
+    """Test classifying the kind of an input."""
+    from metadata_inspector import _classify
+
+    assert _classify("https://foo.org/bar.zarr")[0] == "url"
+    assert _classify("HTTPS://foo.org/bar.zarr")[0] == "url"
+    assert _classify("S3://bucket/bar.zarr")[0] == "url"
+    assert _classify("hsm:/foo/bar.nc") == ("hsm", "/foo/bar.nc", "")
+    assert _classify("/arch/foo/bar.tar")[0] == "hsm"
+    assert _classify(str(netcdf_files))[0] == "dir"
+    nc_file = next(netcdf_files.rglob("*.nc"))
+    assert _classify(str(nc_file))[0] == "file"
+    assert _classify(str(netcdf_files / "*.nc")) == (
+        "glob",
+        str(netcdf_files),
+        "*.nc",
+    )
+    assert _classify(str(netcdf_files / "foo" / "*.nc"))[0] == ""
+
+
 def test_hsm_with_key(patch_file: Path) -> None:
     """Test reading metadata from the hsm."""
     from metadata_inspector import main
@@ -91,6 +155,65 @@ def test_hsm_without_key(patch_file: Path) -> None:
     assert "ua" in out
 
 
+def test_slk_metadata_failures_not_cached(patch_file: Path) -> None:
+    """Test that failed hsm metadata lookups are retried."""
+    import metadata_inspector
+
+    metadata = {"netcdf": {"file_size": "1 MB"}}
+    with mock.patch.object(
+        metadata_inspector, "get_slk_metadata", side_effect=[None, metadata]
+    ) as get_metadata:
+        with pytest.raises(ValueError):
+            metadata_inspector._cached_slk_metadata("/arch/retry.nc")
+        for _ in range(2):
+            assert (
+                metadata_inspector._cached_slk_metadata("/arch/retry.nc")
+                == metadata
+            )
+        assert get_metadata.call_count == 2
+    metadata_inspector._SLK_METADATA.pop("/arch/retry.nc")
+
+
+def test_hsm_broken_entry(patch_file: Path) -> None:
+    """Test that a single broken archive entry does not abort the batch."""
+    import metadata_inspector
+    from metadata_inspector import _open_hsm_datasets
+
+    def _dataset_from_hsm(inp_file: str) -> xr.Dataset:
+        if inp_file.endswith("broken.nc"):
+            raise ValueError("broken")
+        return dataset_from_hsm(inp_file)
+
+    dataset_from_hsm = metadata_inspector.dataset_from_hsm
+    with mock.patch.object(
+        metadata_inspector, "dataset_from_hsm", _dataset_from_hsm
+    ):
+        dsets, failed = _open_hsm_datasets(
+            ["/arch/foo/bar.tar", "/arch/broken.nc"]
+        )
+        assert len(dsets) == 1
+        assert failed == ["/arch/broken.nc: broken"]
+        with pytest.raises(ValueError):
+            _open_hsm_datasets(["/arch/broken.nc"])
+        inputs: list[str | Path] = ["/arch/foo/bar.tar", "/arch/broken.nc"]
+        out, text_io = metadata_inspector.main(inputs)
+        assert "orog" in out
+        assert out.endswith("/arch/broken.nc: broken")
+        assert text_io == sys.stdout
+        out, _ = metadata_inspector.main(inputs, html=True)
+        assert "/arch/broken.nc: broken</p>" in out
+
+
+def test_fs_and_hsm(netcdf_files: Path, patch_file: Path) -> None:
+    """Test reading files from disk and the hsm archive together."""
+    from metadata_inspector import main
+
+    out, text_io = main([netcdf_files, Path("/arch/foo/bar.tar")])
+    assert "precip" in out
+    assert "orog" in out
+    assert text_io == sys.stdout
+
+
 def test_zarr_http(patch_file: Path, https_server: str) -> None:
     from metadata_inspector import main
 